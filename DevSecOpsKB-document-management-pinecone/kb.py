@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 import pinecone
 from llama_index.vector_stores import PineconeVectorStore
 import openai
+from doc_cache import file_extractor, pdf_reader
 import gradio as gr
 import sys, os
 import logging
@@ -39,8 +40,9 @@ from llama_index import set_global_service_context
 set_global_service_context(service_context)
 
 def load_index(directory_path):
-    documents = SimpleDirectoryReader(directory_path, filename_as_id=True).load_data()
+    documents = SimpleDirectoryReader(directory_path, filename_as_id=True, file_extractor=file_extractor()).load_data()
     print(f"loaded {len(documents)} documents")
+    print(pdf_reader.report())
 
     indexes = pinecone.list_indexes()
     print(indexes)
@@ -4,6 +4,7 @@ from llama_index.indices.service_context import ServiceContext
 from langchain.chat_models import ChatOpenAI
 from dotenv import load_dotenv
 import openai
+from doc_cache import file_extractor, pdf_reader
 import gradio as gr
 import sys, os
 import logging
@@ -27,8 +28,9 @@ set_global_service_context(service_context)
 
 def load_index(directory_path):
      
-    documents = SimpleDirectoryReader(directory_path, filename_as_id=True).load_data()
+    documents = SimpleDirectoryReader(directory_path, filename_as_id=True, file_extractor=file_extractor()).load_data()
     print(f"loaded documents with {len(documents)} pages")
+    print(pdf_reader.report())
     
     try:
         # Rebuild storage context
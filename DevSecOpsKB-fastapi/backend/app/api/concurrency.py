@@ -0,0 +1,105 @@
+import asyncio
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Set
+
+from fastapi import HTTPException, status
+
+MAX_CONCURRENT_CHATS = int(os.getenv("MAX_CONCURRENT_CHATS", "16"))  # per worker
+MAX_QUEUED_CHATS = int(os.getenv("MAX_QUEUED_CHATS", "32"))  # per worker, beyond that requests are shed
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "10"))  # seconds a request may wait for a slot
+
+_spawned_tasks: ContextVar[Optional[Set[asyncio.Task]]] = ContextVar(
+    "_spawned_tasks", default=None
+)
+
+
+def _install_task_factory(loop: asyncio.AbstractEventLoop) -> None:
+    previous = loop.get_task_factory()
+    if getattr(previous, "tracks_spawned_tasks", False):
+        return
+
+    def factory(loop, coro, **kwargs):
+        if previous is None:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        else:
+            task = previous(loop, coro, **kwargs)
+        # a task given its own context belongs to whoever set up that context
+        context = kwargs.get("context")
+        tasks = _spawned_tasks.get() if context is None else context.get(_spawned_tasks)
+        if tasks is not None:
+            tasks.add(task)
+        return task
+
+    factory.tracks_spawned_tasks = True
+    loop.set_task_factory(factory)
+
+
+@contextmanager
+def track_spawned_tasks(tasks: Set[asyncio.Task]):
+    """
+    Collect into `tasks` every task created while the block runs, including
+    tasks those tasks create, so background work such as LLM streaming can
+    be cancelled once nobody is waiting for it.
+    """
+    _install_task_factory(asyncio.get_running_loop())
+    token = _spawned_tasks.set(tasks)
+    try:
+        yield tasks
+    finally:
+        _spawned_tasks.reset(token)
+
+
+class ConcurrencyLimiter:
+    """
+    Bounds the requests running at once in this worker. Requests beyond the
+    limit wait in a bounded queue and are shed with 503 when the queue is
+    full or the wait times out.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_CHATS,
+        max_queued: int = MAX_QUEUED_CHATS,
+        queue_timeout: float = CHAT_QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.queued = 0
+        self.shed = 0
+
+    def _overloaded(self, detail: str) -> HTTPException:
+        self.shed += 1
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": "1"},
+        )
+
+    async def acquire(self) -> None:
+        if self._semaphore.locked() and self.queued >= self.max_queued:
+            raise self._overloaded("Too many chat requests, try again later")
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._overloaded("Timed out waiting for a chat slot, try again later")
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def get_metrics(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "shed": self.shed,
+        }
@@ -1,15 +1,26 @@
-from typing import List
+import asyncio
+import os
+import time
+from typing import List, Set
 
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from llama_index.chat_engine.types import BaseChatEngine
+from starlette.background import BackgroundTask
 
-from app.engine.index import get_chat_engine
+from app.api.concurrency import ConcurrencyLimiter, track_spawned_tasks
+from app.engine.constants import DEFAULT_KB_ID
+from app.engine.index import get_chat_engine, index_registry
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from llama_index.llms.base import ChatMessage
 from llama_index.llms.types import MessageRole
 from pydantic import BaseModel
 
 chat_router = r = APIRouter()
+chat_limiter = ConcurrencyLimiter()
+
+FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "64"))  # buffered characters that trigger a write
+FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))  # seconds between writes at most
+DISCONNECT_POLL_INTERVAL = 0.5  # seconds between disconnect checks before streaming starts
 
 
 class _Message(BaseModel):
@@ -25,8 +36,10 @@ class _ChatData(BaseModel):
 async def chat(
     request: Request,
     data: _ChatData,
+    kb: str = DEFAULT_KB_ID,
     chat_engine: BaseChatEngine = Depends(get_chat_engine),
 ):
+    start = time.perf_counter()
     # check preconditions and get last message
     if len(data.messages) == 0:
         raise HTTPException(
@@ -48,15 +61,87 @@ async def chat(
         for m in data.messages
     ]
 
-    # query chat engine
-    response = await chat_engine.astream_chat(lastMessage.content, messages)
+    # wait for a slot, requests are shed with 503 when this worker is overloaded
+    await chat_limiter.acquire()
 
-    # stream response
-    async def event_generator():
-        async for token in response.async_response_gen():
-            # If client closes connection, stop sending events
-            if await request.is_disconnected():
+    # every task spawned for this request (retrieval, LLM streaming) is tracked so it can be cancelled
+    tasks: Set[asyncio.Task] = set()
+    completed = False
+    finished = False
+
+    def finish():
+        nonlocal finished
+        if finished:
+            return
+        finished = True
+        if not completed:
+            for task in tasks:
+                task.cancel()
+        chat_limiter.release()
+        index_registry.record_request(kb, time.perf_counter() - start)
+
+    try:
+        # query chat engine, giving up as soon as the client goes away
+        with track_spawned_tasks(tasks):
+            chat_task = asyncio.create_task(
+                chat_engine.astream_chat(lastMessage.content, messages)
+            )
+        while True:
+            done, _ = await asyncio.wait({chat_task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
                 break
-            yield token
+            if await request.is_disconnected():
+                finish()
+                return Response(status_code=status.HTTP_204_NO_CONTENT)
+        response = chat_task.result()
+    except BaseException:
+        finish()
+        raise
+
+    # stream response in batches of tokens, checking for disconnects once per batch
+    async def event_generator():
+        nonlocal completed
+        loop = asyncio.get_running_loop()
+        buffer: List[str] = []
+        buffered = 0
+        last_flush = loop.time()
+        try:
+            async for token in response.async_response_gen():
+                buffer.append(token)
+                buffered += len(token)
+                if buffered < FLUSH_CHARS and loop.time() - last_flush < FLUSH_INTERVAL:
+                    continue
+                # If client closes connection, stop sending events
+                if await request.is_disconnected():
+                    return
+                yield "".join(buffer)
+                buffer.clear()
+                buffered = 0
+                last_flush = loop.time()
+            completed = True
+            if buffer:
+                yield "".join(buffer)
+        finally:
+            finish()
+
+    async def finish_in_background():
+        finish()
+
+    # the background task also runs when the stream is cancelled before it started
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/plain",
+        background=BackgroundTask(finish_in_background),
+    )
+
 
-    return StreamingResponse(event_generator(), media_type="text/plain")
+@r.get("/metrics")
+async def metrics():
+    # with several workers this reports the worker that served the request, identified by its pid
+    return {
+        "worker_pid": os.getpid(),
+        "resident_bytes": index_registry.resident_bytes,
+        "memory_budget": index_registry.memory_budget,
+        "knowledge_bases": index_registry.get_metrics(),
+        "chat_concurrency": chat_limiter.get_metrics(),
+    }
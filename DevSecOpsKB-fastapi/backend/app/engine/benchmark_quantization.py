@@ -0,0 +1,119 @@
+from dotenv import load_dotenv
+
+# load .env before the app modules below read their settings at import time
+load_dotenv()
+
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from app.engine.constants import DEFAULT_KB_ID, PQ_SUBSPACES, RERANK_FACTOR
+from app.engine.quantization import (
+    encode_pq,
+    int8_scorer,
+    pq_scorer,
+    quantize_int8,
+    train_pq,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+
+NUM_QUERIES = 100
+TOP_K = 2  # default similarity_top_k of the chat engine
+QUERY_NOISE = 0.5  # relative noise added to stored vectors to make queries
+
+
+def load_embeddings(kb_id):
+    from app.engine.index import get_kb_dirs
+    from app.engine.snapshot import EMBEDDINGS_FILE, SNAPSHOTS_DIR, get_current_snapshot
+
+    _, storage_dir = get_kb_dirs(kb_id)
+    version = get_current_snapshot(storage_dir)
+    if version is None:
+        logger.warning(
+            f"No snapshot for knowledge base {kb_id}, benchmarking 10000 random vectors"
+        )
+        embeddings = np.random.default_rng(0).normal(size=(10000, 1536))
+        embeddings = embeddings.astype(np.float32)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return np.load(os.path.join(storage_dir, SNAPSHOTS_DIR, version, EMBEDDINGS_FILE))
+
+
+def make_queries(embeddings, rng):
+    picks = embeddings[rng.choice(len(embeddings), NUM_QUERIES)]
+    noise = rng.normal(size=picks.shape).astype(np.float32) / np.sqrt(picks.shape[1])
+    queries = picks + QUERY_NOISE * noise
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def top_k(scores, k):
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def run(name, scanned, stored, search, queries, expected):
+    hits = 0
+    start = time.perf_counter()
+    for q, exact in zip(queries, expected):
+        hits += len(set(search(q).tolist()) & set(exact.tolist()))
+    latency = (time.perf_counter() - start) / len(queries) * 1000
+    recall = hits / expected.size
+    print(
+        f"{name:<16} {scanned / 2**20:>12.2f} {stored / 2**20:>12.2f} "
+        f"{recall:>10.3f} {latency:>12.3f}"
+    )
+
+
+def benchmark(embeddings):
+    rng = np.random.default_rng(0)
+    queries = make_queries(embeddings, rng)
+    expected = np.array([top_k(embeddings @ q, TOP_K) for q in queries])
+    shortlist = TOP_K * RERANK_FACTOR
+
+    def rerank(approximate):
+        def search(q):
+            candidates = top_k(approximate(q, None), shortlist)
+            return candidates[top_k(embeddings[candidates] @ q, TOP_K)]
+
+        return search
+
+    print(f"{len(embeddings)} vectors, {embeddings.shape[1]} dims, top {TOP_K}, re-ranking {shortlist} candidates")
+    # scanned: bytes read by every query, what the index memory budget counts
+    # stored: bytes on disk, the +rerank modes also keep the float32 matrix
+    print(
+        f"{'mode':<16} {'scanned MiB':>12} {'stored MiB':>12} "
+        f"{f'recall@{TOP_K}':>10} {'latency ms':>12}"
+    )
+    float32_bytes = embeddings.nbytes
+    float32 = lambda q: top_k(embeddings @ q, TOP_K)
+    run("float32", float32_bytes, float32_bytes, float32, queries, expected)
+
+    codes, scales = quantize_int8(embeddings)
+    int8 = int8_scorer(codes, scales)
+    int8_bytes = codes.nbytes + scales.nbytes
+    int8_search = lambda q: top_k(int8(q, None), TOP_K)
+    run("int8", int8_bytes, int8_bytes, int8_search, queries, expected)
+    run(
+        "int8+rerank",
+        int8_bytes,
+        int8_bytes + float32_bytes,
+        rerank(int8),
+        queries,
+        expected,
+    )
+
+    codebooks = train_pq(embeddings, PQ_SUBSPACES)
+    pq = pq_scorer(encode_pq(embeddings, codebooks), codebooks)
+    pq_bytes = len(embeddings) * PQ_SUBSPACES + codebooks.nbytes
+    pq_search = lambda q: top_k(pq(q, None), TOP_K)
+    run("pq", pq_bytes, pq_bytes, pq_search, queries, expected)
+    run("pq+rerank", pq_bytes, pq_bytes + float32_bytes, rerank(pq), queries, expected)
+
+
+if __name__ == "__main__":
+    benchmark(load_embeddings(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_KB_ID))
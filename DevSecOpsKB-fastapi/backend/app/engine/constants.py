@@ -1,4 +1,12 @@
+import os
+
 STORAGE_DIR = "storage"  # directory to cache the generated index
 DATA_DIR = "data"  # directory containing the documents to index
 CHUNK_SIZE = 1024
 CHUNK_OVERLAP = 20
+DEFAULT_KB_ID = "default"  # knowledge base served from STORAGE_DIR and DATA_DIR
+KB_ROOT_DIR = os.getenv("KB_ROOT_DIR", "kb")  # other knowledge bases live in KB_ROOT_DIR/<kb_id>/{data,storage}
+INDEX_MEMORY_BUDGET = int(os.getenv("INDEX_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024  # bytes of loaded indexes kept per worker
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")  # "none", "int8" or "pq" for snapshot embeddings
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", "192"))  # bytes per vector with product quantization, must divide 1536
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "100"))  # quantized candidates per result re-ranked with exact scores
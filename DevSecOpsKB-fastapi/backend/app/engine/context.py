@@ -1,14 +1,25 @@
+from functools import lru_cache
+
 from llama_index import ServiceContext
 
 from app.context import create_base_context
 from app.engine.constants import CHUNK_SIZE, CHUNK_OVERLAP
+from app.engine.embedding import CachedQueryEmbedding
+
+
+@lru_cache(maxsize=None)
+def get_embed_model():
+    # one instance per process so the query embedding cache and batcher are shared by all requests
+    return CachedQueryEmbedding(create_base_context().embed_model)
 
 
+@lru_cache(maxsize=None)
 def create_service_context():
+    # shared by every loaded index so all knowledge bases reuse the same LLM and embedding clients
     base = create_base_context()
     return ServiceContext.from_defaults(
         llm=base.llm,
-        embed_model=base.embed_model,
+        embed_model=get_embed_model(),
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
     )
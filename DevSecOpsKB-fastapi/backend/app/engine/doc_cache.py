@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from llama_index import Document
+from llama_index.readers.base import BaseReader
+from llama_index.readers.file.docs_reader import PDFReader
+
+# directory of extracted PDF text, shared with the other apps so unchanged PDFs are parsed only once
+DOC_CACHE_DIR = os.getenv(
+    "DOC_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "devsecopskb", "documents"),
+)
+CACHE_FORMAT = 1  # bump when the cached entry layout changes
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(file: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class CachedPDFReader(BaseReader):
+    """PDFReader that keeps the extracted text and metadata of each PDF on disk, keyed by file content hash."""
+
+    def __init__(self) -> None:
+        self.pdf_reader = PDFReader()
+        self.hits = 0
+        self.misses = 0
+        self.parse_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def load_data(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        metadata: Optional[Dict] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        file = Path(file)
+        path = os.path.join(DOC_CACHE_DIR, f"{file_hash(file)}-v{CACHE_FORMAT}.json.gz")
+
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+            self.saved_seconds += entry["parse_seconds"]
+            self.hits += 1
+        except (OSError, EOFError, zlib.error, ValueError, KeyError):
+            entry = self._parse(file, path, **kwargs)
+
+        # some llama_index versions pass the caller's metadata as metadata, not extra_info
+        extra_info = metadata if metadata is not None else extra_info
+        documents = []
+        for page in entry["pages"]:
+            # same metadata as PDFReader, file_name follows the file's current name
+            info = {
+                key: (file.name if key == "file_name" else value)
+                for key, value in page["metadata"].items()
+            }
+            if extra_info is not None:
+                info.update(extra_info)
+            documents.append(Document(text=page["text"], extra_info=info))
+        return documents
+
+    def _parse(self, file: Path, path: str, **kwargs: Any) -> dict:
+        start = time.perf_counter()
+        # the caller's metadata is applied on each load, not cached
+        documents = self.pdf_reader.load_data(file, **kwargs)
+        parse_seconds = time.perf_counter() - start
+
+        entry = {
+            "parse_seconds": parse_seconds,
+            "pages": [
+                {"text": doc.text, "metadata": doc.extra_info or {}}
+                for doc in documents
+            ],
+        }
+
+        # write to a unique temporary file first so concurrent readers never see a partial entry
+        tmp_path = None
+        try:
+            os.makedirs(DOC_CACHE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=DOC_CACHE_DIR, suffix=".tmp")
+            with os.fdopen(fd, "wb") as raw, gzip.open(
+                raw, "wt", encoding="utf-8"
+            ) as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # an unwritable cache only costs the parse next time, the PDF still loads
+            logger.warning(f"Could not cache {file.name} in {DOC_CACHE_DIR}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.misses += 1
+        self.parse_seconds += parse_seconds
+        return entry
+
+    def report(self) -> str:
+        return (
+            f"document cache: {self.hits} PDFs loaded from cache, "
+            f"{self.misses} parsed in {self.parse_seconds:.2f}s, "
+            f"{self.saved_seconds:.2f}s of parsing saved"
+        )
+
+
+pdf_reader = CachedPDFReader()
+
+
+def file_extractor() -> Dict[str, BaseReader]:
+    # SimpleDirectoryReader falls back to its default readers for the other file types
+    return {".pdf": pdf_reader}
@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from llama_index.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.base import BaseEmbedding, Embedding
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+QUERY_BATCH_WINDOW = float(os.getenv("QUERY_EMBEDDING_BATCH_WINDOW", "0.005"))  # seconds
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+class CachedQueryEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model with an LRU cache of query embeddings keyed by
+    normalized text, and coalesces async queries arriving within
+    `batch_window` seconds into a single batched embedding request.
+
+    Batched queries go through the wrapped model's text embedding endpoint,
+    which is the same as its query endpoint for OpenAI's ada-002.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache_size: int = PrivateAttr()
+    _batch_window: float = PrivateAttr()
+    _cache: "OrderedDict[str, Embedding]" = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _pending: Dict[str, Tuple[str, asyncio.Future]] = PrivateAttr()
+    _flush_handle: Optional[asyncio.TimerHandle] = PrivateAttr()
+    _batch_tasks: Set[asyncio.Task] = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache_size: int = QUERY_CACHE_SIZE,
+        batch_window: float = QUERY_BATCH_WINDOW,
+        **kwargs: Any,
+    ) -> None:
+        self._embed_model = embed_model
+        self._cache_size = cache_size
+        self._batch_window = batch_window
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flush_handle = None
+        self._batch_tasks = set()
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedQueryEmbedding"
+
+    def _cache_get(self, key: str) -> Optional[Embedding]:
+        with self._lock:
+            embedding = self._cache.get(key)
+            if embedding is not None:
+                self._cache.move_to_end(key)
+            return embedding
+
+    def _cache_put(self, key: str, embedding: Embedding) -> None:
+        with self._lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = normalize_query(query)
+        embedding = self._cache_get(key)
+        if embedding is None:
+            embedding = self._embed_model.get_query_embedding(query)
+            self._cache_put(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        key = normalize_query(query)
+        embedding = self._cache_get(key)
+        if embedding is not None:
+            return embedding
+
+        # join a batch that already contains the same query
+        if key in self._pending:
+            return await asyncio.shield(self._pending[key][1])
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[key] = (query, future)
+        # the batch is shared by every coalesced caller, so it runs outside the
+        # context of the request that opened it and is not cancelled with it
+        if len(self._pending) >= self.embed_batch_size:
+            contextvars.Context().run(self._flush)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self._batch_window, self._flush, context=contextvars.Context()
+            )
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            # keep a reference so the task is not garbage collected while in flight
+            task = asyncio.ensure_future(self._embed_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _embed_batch(self, batch: Dict[str, Tuple[str, asyncio.Future]]) -> None:
+        keys = list(batch.keys())
+        try:
+            embeddings = await self._embed_model.aget_text_embedding_batch(
+                [batch[key][0] for key in keys]
+            )
+        except BaseException as e:
+            # fail every coalesced caller, including on cancellation, so none waits forever
+            error = (
+                e
+                if isinstance(e, Exception)
+                else RuntimeError("Query embedding batch was cancelled")
+            )
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_exception(error)
+            if isinstance(e, Exception):
+                return
+            raise
+        for key, embedding in zip(keys, embeddings):
+            self._cache_put(key, embedding)
+            future = batch[key][1]
+            if not future.done():
+                future.set_result(embedding)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed_model.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self._embed_model.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed_model.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self._embed_model.aget_text_embedding_batch(texts)
@@ -1,12 +1,17 @@
-import logging
-
 from dotenv import load_dotenv
 
-from app.engine.constants import DATA_DIR, STORAGE_DIR
-from app.engine.context import create_service_context
-
+# load .env before the app modules below read their settings at import time
 load_dotenv()
 
+import logging
+import sys
+
+from app.engine.constants import DEFAULT_KB_ID
+from app.engine.context import create_service_context
+from app.engine.doc_cache import file_extractor, pdf_reader
+from app.engine.index import get_kb_dirs
+from app.engine.snapshot import export_snapshot
+
 from llama_index import (
     SimpleDirectoryReader,
     VectorStoreIndex,
@@ -16,16 +21,30 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 
-def generate_datasource(service_context):
-    logger.info("Creating new index")
+def generate_datasource(service_context, kb_id=DEFAULT_KB_ID):
+    data_dir, storage_dir = get_kb_dirs(kb_id)
+    logger.info(f"Creating new index for knowledge base {kb_id}")
     # load the documents and create the index
-    documents = SimpleDirectoryReader(DATA_DIR).load_data()
+    documents = SimpleDirectoryReader(
+        data_dir, file_extractor=file_extractor()
+    ).load_data()
+    logger.info(pdf_reader.report())
     index = VectorStoreIndex.from_documents(documents, service_context=service_context)
     # store it for later
-    index.storage_context.persist(STORAGE_DIR)
-    logger.info(f"Finished creating new index. Stored in {STORAGE_DIR}")
+    index.storage_context.persist(storage_dir)
+    logger.info(f"Finished creating new index. Stored in {storage_dir}")
+    # publish a read-only snapshot, running workers switch to it on their next request
+    snapshot_dir = export_snapshot(storage_dir)
+    logger.info(f"Published read-only snapshot {snapshot_dir}")
 
 
 if __name__ == "__main__":
-    service_context = create_service_context()
-    generate_datasource(service_context)
+    args = sys.argv[1:]
+    kb_id = next((arg for arg in args if not arg.startswith("--")), DEFAULT_KB_ID)
+    if "--snapshot-only" in args:
+        # publish a snapshot of the already persisted index without re-embedding the documents
+        _, storage_dir = get_kb_dirs(kb_id)
+        logger.info(f"Published read-only snapshot {export_snapshot(storage_dir)}")
+    else:
+        service_context = create_service_context()
+        generate_datasource(service_context, kb_id)
@@ -1,25 +1,181 @@
 import logging
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
 from llama_index import (
     StorageContext,
     load_index_from_storage,
 )
+from llama_index.indices.base import BaseIndex
 
-from app.engine.constants import STORAGE_DIR
+from app.engine.constants import (
+    DATA_DIR,
+    DEFAULT_KB_ID,
+    INDEX_MEMORY_BUDGET,
+    KB_ROOT_DIR,
+    STORAGE_DIR,
+)
 from app.engine.context import create_service_context
+from app.engine.snapshot import (
+    get_current_snapshot,
+    get_snapshot_size,
+    load_snapshot_storage_context,
+)
+
+KB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# loaded JSON stores take roughly twice their on-disk size as Python objects
+INDEX_MEMORY_FACTOR = 2
+SNAPSHOT_LOAD_ATTEMPTS = 3
+
+
+def get_kb_dirs(kb_id: str) -> Tuple[str, str]:
+    """Return the (data, storage) directories of a knowledge base."""
+    if kb_id == DEFAULT_KB_ID:
+        return DATA_DIR, STORAGE_DIR
+    if not KB_ID_PATTERN.match(kb_id):
+        raise ValueError(f"Invalid knowledge base id: {kb_id!r}")
+    kb_dir = os.path.join(KB_ROOT_DIR, kb_id)
+    return os.path.join(kb_dir, "data"), os.path.join(kb_dir, "storage")
+
+
+def _estimate_index_size(storage_dir: str) -> int:
+    size = sum(
+        entry.stat().st_size for entry in os.scandir(storage_dir) if entry.is_file()
+    )
+    return size * INDEX_MEMORY_FACTOR
+
+
+@dataclass
+class TenantMetrics:
+    requests: int = 0
+    request_seconds: float = 0.0
+    index_loads: int = 0
+    index_load_seconds: float = 0.0
+    evictions: int = 0
+    resident_bytes: int = 0
+
+
+class IndexRegistry:
+    """
+    Keeps the indexes of several knowledge bases loaded in one worker process,
+    evicting the least recently used ones once their estimated memory
+    exceeds the budget. Indexes with a read-only snapshot are served from it
+    and reloaded as soon as a newer snapshot becomes current.
+    """
+
+    def __init__(self, memory_budget: int = INDEX_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self._indexes: "OrderedDict[str, Tuple[BaseIndex, int, Optional[str]]]" = OrderedDict()
+        self._metrics: Dict[str, TenantMetrics] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def get_index(self, kb_id: str) -> BaseIndex:
+        _, storage_dir = get_kb_dirs(kb_id)
+        for attempt in range(SNAPSHOT_LOAD_ATTEMPTS):
+            version = get_current_snapshot(storage_dir)
+            try:
+                return self._get_index(kb_id, version)
+            except FileNotFoundError:
+                # the snapshot was replaced and removed between reading CURRENT and loading it
+                if version is None or attempt == SNAPSHOT_LOAD_ATTEMPTS - 1:
+                    raise
+
+    def _get_index(self, kb_id: str, version: Optional[str]) -> BaseIndex:
+        with self._lock:
+            entry = self._indexes.get(kb_id)
+            if entry is not None and entry[2] == version:
+                self._indexes.move_to_end(kb_id)
+                return entry[0]
+            load_lock = self._load_locks.setdefault(kb_id, threading.Lock())
+
+        # load outside the registry lock so other knowledge bases keep being served,
+        # requests already holding the previous index keep using it until they finish
+        with load_lock:
+            with self._lock:
+                entry = self._indexes.get(kb_id)
+                if entry is not None and entry[2] == version:
+                    return entry[0]
+            index, size, seconds = self._load_index(kb_id, version)
+            with self._lock:
+                metrics = self._metrics.setdefault(kb_id, TenantMetrics())
+                metrics.index_loads += 1
+                metrics.index_load_seconds += seconds
+                metrics.resident_bytes = size
+                self._indexes[kb_id] = (index, size, version)
+                self._indexes.move_to_end(kb_id)
+                self._evict()
+            return index
+
+    def _load_index(
+        self, kb_id: str, version: Optional[str]
+    ) -> Tuple[BaseIndex, int, float]:
+        _, storage_dir = get_kb_dirs(kb_id)
+        # check if storage already exists
+        if not os.path.exists(storage_dir):
+            raise Exception(
+                f"StorageContext is empty - call 'python app/engine/generate.py {kb_id}' to generate the storage first"
+            )
+        logger = logging.getLogger("uvicorn")
+        # load the existing index, preferring the shared read-only snapshot
+        start = time.perf_counter()
+        if version is not None:
+            logger.info(f"Loading index from snapshot {version} in {storage_dir}...")
+            storage_context = load_snapshot_storage_context(storage_dir, version)
+            size = get_snapshot_size(storage_dir, version)
+        else:
+            logger.info(f"Loading index from {storage_dir}...")
+            storage_context = StorageContext.from_defaults(persist_dir=storage_dir)
+            size = _estimate_index_size(storage_dir)
+        index = load_index_from_storage(
+            storage_context, service_context=create_service_context()
+        )
+        seconds = time.perf_counter() - start
+        logger.info(f"Finished loading index from {storage_dir} in {seconds:.2f}s")
+        return index, size, seconds
+
+    def _evict(self) -> None:
+        # always keep the most recently used index, even if it alone exceeds the budget
+        while len(self._indexes) > 1 and self.resident_bytes > self.memory_budget:
+            kb_id, _ = self._indexes.popitem(last=False)
+            metrics = self._metrics[kb_id]
+            metrics.evictions += 1
+            metrics.resident_bytes = 0
+            logging.getLogger("uvicorn").info(f"Evicted index {kb_id} from memory")
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(size for _, size, _ in self._indexes.values())
+
+    def record_request(self, kb_id: str, seconds: float) -> None:
+        with self._lock:
+            metrics = self._metrics.setdefault(kb_id, TenantMetrics())
+            metrics.requests += 1
+            metrics.request_seconds += seconds
+
+    def get_metrics(self) -> Dict[str, dict]:
+        # counters of this worker process only, each uvicorn worker has its own registry
+        with self._lock:
+            return {kb_id: asdict(m) for kb_id, m in self._metrics.items()}
+
+
+index_registry = IndexRegistry()
 
 
-def get_chat_engine():
-    service_context = create_service_context()
-    # check if storage already exists
-    if not os.path.exists(STORAGE_DIR):
-        raise Exception(
-            "StorageContext is empty - call 'python app/engine/generate.py' to generate the storage first"
+def get_chat_engine(kb: str = DEFAULT_KB_ID):
+    try:
+        _, storage_dir = get_kb_dirs(kb)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if kb != DEFAULT_KB_ID and not os.path.exists(storage_dir):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown knowledge base: {kb}",
         )
-    logger = logging.getLogger("uvicorn")
-    # load the existing index
-    logger.info(f"Loading index from {STORAGE_DIR}...")
-    storage_context = StorageContext.from_defaults(persist_dir=STORAGE_DIR)
-    index = load_index_from_storage(storage_context, service_context=service_context)
-    logger.info(f"Finished loading index from {STORAGE_DIR}")
-    return index.as_chat_engine()
+    return index_registry.get_index(kb).as_chat_engine()
@@ -0,0 +1,147 @@
+import os
+from typing import Callable, Optional
+
+import numpy as np
+
+INT8_CODES_FILE = "embeddings_int8.npy"
+INT8_SCALES_FILE = "embeddings_int8_scales.npy"
+PQ_CODES_FILE = "embeddings_pq.npy"
+PQ_CODEBOOKS_FILE = "embeddings_pq_codebooks.npy"
+
+QUANTIZATION_MODES = ["none", "int8", "pq"]
+QUANTIZED_FILES = {
+    "int8": [INT8_CODES_FILE, INT8_SCALES_FILE],
+    "pq": [PQ_CODES_FILE, PQ_CODEBOOKS_FILE],
+}
+# rows scored at a time, bounds the float32 scratch memory of a query
+SCORE_BLOCK_SIZE = 8192
+
+# scores a query against all rows, or only the given row positions
+Scorer = Callable[[np.ndarray, Optional[np.ndarray]], np.ndarray]
+
+
+def _blocked(n: int, score_block: Callable[[slice], np.ndarray]) -> np.ndarray:
+    scores = np.empty(n, dtype=np.float32)
+    for start in range(0, n, SCORE_BLOCK_SIZE):
+        block = slice(start, min(start + SCORE_BLOCK_SIZE, n))
+        scores[block] = score_block(block)
+    return scores
+
+
+def quantize_int8(embeddings: np.ndarray):
+    """Symmetric per-vector scalar quantization to int8 codes and float32 scales."""
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(embeddings / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def int8_scorer(codes: np.ndarray, scales: np.ndarray) -> Scorer:
+    def score(q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        c, s = (codes, scales) if rows is None else (codes[rows], scales[rows])
+        return _blocked(
+            len(c), lambda b: (c[b].astype(np.float32) @ q) * s[b]
+        )
+
+    return score
+
+
+def train_pq(
+    embeddings: np.ndarray,
+    num_subspaces: int,
+    num_centroids: int = 256,
+    iterations: int = 20,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Train product quantization codebooks with k-means in each subspace.
+    Returns an array of shape (num_subspaces, num_centroids, dim // num_subspaces).
+    """
+    n, dim = embeddings.shape
+    if dim % num_subspaces:
+        raise ValueError(f"Dimension {dim} is not divisible by {num_subspaces} subspaces")
+    num_centroids = min(num_centroids, n)
+    sub_dim = dim // num_subspaces
+    rng = np.random.default_rng(seed)
+    codebooks = np.empty((num_subspaces, num_centroids, sub_dim), dtype=np.float32)
+    for m in range(num_subspaces):
+        x = embeddings[:, m * sub_dim : (m + 1) * sub_dim]
+        centroids = x[rng.choice(n, num_centroids, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _nearest(x, centroids)
+            for k in range(num_centroids):
+                members = x[assignments == k]
+                if len(members):
+                    centroids[k] = members.mean(axis=0)
+        codebooks[m] = centroids
+    return codebooks
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    distances = (
+        (x * x).sum(axis=1)[:, None]
+        - 2 * x @ centroids.T
+        + (centroids * centroids).sum(axis=1)[None, :]
+    )
+    return distances.argmin(axis=1)
+
+
+def encode_pq(embeddings: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    num_subspaces, _, sub_dim = codebooks.shape
+    codes = np.empty((len(embeddings), num_subspaces), dtype=np.uint8)
+    for m in range(num_subspaces):
+        x = embeddings[:, m * sub_dim : (m + 1) * sub_dim]
+        codes[:, m] = _nearest(x, codebooks[m])
+    return codes
+
+
+def pq_scorer(codes: np.ndarray, codebooks: np.ndarray) -> Scorer:
+    num_subspaces, _, sub_dim = codebooks.shape
+    subspaces = np.arange(num_subspaces)
+
+    def score(q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        # inner product of each query subvector with every centroid of its subspace
+        table = np.einsum("mkd,md->mk", codebooks, q.reshape(num_subspaces, sub_dim))
+        c = codes if rows is None else codes[rows]
+        return _blocked(len(c), lambda b: table[subspaces, c[b]].sum(axis=1))
+
+    return score
+
+
+def save_quantized(
+    snapshot_dir: str, embeddings: np.ndarray, quantization: str, pq_subspaces: int
+) -> None:
+    """Write the quantized copy of a snapshot's normalized embeddings."""
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown vector quantization {quantization!r}")
+    # an empty store has nothing to quantize, queries on it return no results anyway
+    if not len(embeddings):
+        return
+    if quantization == "int8":
+        codes, scales = quantize_int8(embeddings)
+        np.save(os.path.join(snapshot_dir, INT8_CODES_FILE), codes)
+        np.save(os.path.join(snapshot_dir, INT8_SCALES_FILE), scales)
+    elif quantization == "pq":
+        codebooks = train_pq(embeddings, pq_subspaces)
+        np.save(os.path.join(snapshot_dir, PQ_CODES_FILE), encode_pq(embeddings, codebooks))
+        np.save(os.path.join(snapshot_dir, PQ_CODEBOOKS_FILE), codebooks)
+
+
+def has_quantized(snapshot_dir: str, quantization: str) -> bool:
+    files = QUANTIZED_FILES.get(quantization)
+    return bool(files) and all(
+        os.path.exists(os.path.join(snapshot_dir, name)) for name in files
+    )
+
+
+def load_scorer(snapshot_dir: str, quantization: str) -> Optional[Scorer]:
+    """Memory-map the quantized embeddings of a snapshot, if it has them."""
+    if not has_quantized(snapshot_dir, quantization):
+        return None
+    build = int8_scorer if quantization == "int8" else pq_scorer
+    return build(
+        *(
+            np.load(os.path.join(snapshot_dir, name), mmap_mode="r")
+            for name in QUANTIZED_FILES[quantization]
+        )
+    )
@@ -0,0 +1,323 @@
+import json
+import mmap
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index import StorageContext
+from llama_index.schema import BaseNode
+from llama_index.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.storage.kvstore.types import DEFAULT_COLLECTION, BaseKVStore
+from llama_index.vector_stores.types import (
+    VectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+from app.engine.constants import PQ_SUBSPACES, RERANK_FACTOR, VECTOR_QUANTIZATION
+from app.engine.quantization import (
+    QUANTIZED_FILES,
+    Scorer,
+    has_quantized,
+    load_scorer,
+    save_quantized,
+)
+
+SNAPSHOTS_DIR = "snapshots"  # subdirectory of a storage dir holding the read-only snapshots
+CURRENT_FILE = "CURRENT"  # names the snapshot workers should serve
+SNAPSHOTS_TO_KEEP = 2
+SNAPSHOT_GRACE_SECONDS = 300  # older snapshots are kept this long after being replaced
+BUILD_SUFFIX = ".building"  # snapshots being exported, renamed into place once complete
+
+EMBEDDINGS_FILE = "embeddings.npy"
+EMBEDDING_IDS_FILE = "embedding_ids.json"
+DOCSTORE_FILE = "docstore.bin"
+DOCSTORE_OFFSETS_FILE = "docstore_offsets.json"
+COPIED_FILES = ["index_store.json", "graph_store.json"]
+
+
+class ReadOnlyStoreError(Exception):
+    pass
+
+
+class MmapKVStore(BaseKVStore):
+    """
+    Read-only key-value store over a memory-mapped file of JSON values, so
+    every worker process shares the same physical pages of the node store.
+    """
+
+    def __init__(self, data_path: str, offsets_path: str) -> None:
+        with open(offsets_path) as f:
+            self._offsets: Dict[str, Dict[str, List[int]]] = json.load(f)
+        with open(data_path, "rb") as f:
+            self._mmap = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if os.path.getsize(data_path) > 0
+                else None
+            )
+
+    def _read(self, offset: int, length: int) -> dict:
+        return json.loads(self._mmap[offset : offset + length])
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        location = self._offsets.get(collection, {}).get(key)
+        if location is None:
+            return None
+        return self._read(*location)
+
+    async def aget(
+        self, key: str, collection: str = DEFAULT_COLLECTION
+    ) -> Optional[dict]:
+        return self.get(key, collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return {
+            key: self._read(*location)
+            for key, location in self._offsets.get(collection, {}).items()
+        }
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection)
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        raise ReadOnlyStoreError("Snapshot node stores are read-only")
+
+    async def aput(
+        self, key: str, val: dict, collection: str = DEFAULT_COLLECTION
+    ) -> None:
+        self.put(key, val, collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        raise ReadOnlyStoreError("Snapshot node stores are read-only")
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection)
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Read-only vector store over a memory-mapped matrix of L2-normalized
+    float32 embeddings, scored with cosine similarity like SimpleVectorStore.
+
+    With an approximate scorer over quantized embeddings, candidates are
+    found on the quantized codes and the best `rerank_factor` times
+    `similarity_top_k` of them are re-ranked with exact scores, so only
+    their rows of the float32 matrix are paged in.
+    """
+
+    stores_text: bool = False
+
+    def __init__(
+        self,
+        embeddings_path: str,
+        ids_path: str,
+        approximate_scorer: Optional[Scorer] = None,
+        rerank_factor: int = RERANK_FACTOR,
+    ) -> None:
+        # mmap_mode="r" maps the file read-only, so pages are shared across workers and never copied
+        self._embeddings = np.load(embeddings_path, mmap_mode="r")
+        with open(ids_path) as f:
+            self._ids: List[str] = json.load(f)
+        self._positions = {node_id: i for i, node_id in enumerate(self._ids)}
+        self._approximate_scorer = approximate_scorer
+        self._rerank_factor = rerank_factor
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        raise ReadOnlyStoreError("Snapshot vector stores are read-only")
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        raise ReadOnlyStoreError("Snapshot vector stores are read-only")
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Snapshot vector stores do not support mode {query.mode}")
+        if query.filters is not None:
+            raise ValueError("Snapshot vector stores do not support metadata filters")
+        if not self._ids:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        q = np.array(query.query_embedding, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+
+        if query.node_ids is not None:
+            rows = np.array(
+                [self._positions[i] for i in query.node_ids if i in self._positions],
+                dtype=np.int64,
+            )
+        else:
+            rows = None
+
+        if self._approximate_scorer is not None:
+            # shortlist on the quantized codes, then score the shortlist exactly
+            approximate = self._approximate_scorer(q, rows)
+            shortlist = _top_k(approximate, query.similarity_top_k * self._rerank_factor)
+            rows = shortlist if rows is None else rows[shortlist]
+
+        scores = (self._embeddings if rows is None else self._embeddings[rows]) @ q
+
+        top = _top_k(scores, query.similarity_top_k)
+        positions = top if rows is None else rows[top]
+        return VectorStoreQueryResult(
+            similarities=scores[top].tolist(),
+            ids=[self._ids[i] for i in positions],
+        )
+
+    async def aquery(
+        self, query: VectorStoreQuery, **kwargs: Any
+    ) -> VectorStoreQueryResult:
+        return self.query(query, **kwargs)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _read_json(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: Any) -> None:
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def _vector_store_path(storage_dir: str) -> str:
+    for name in ["default__vector_store.json", "vector_store.json"]:
+        path = os.path.join(storage_dir, name)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No vector store found in {storage_dir}")
+
+
+def export_snapshot(storage_dir: str, quantization: str = VECTOR_QUANTIZATION) -> str:
+    """
+    Convert the JSON stores persisted in `storage_dir` into a new read-only
+    snapshot and make it current. Running workers switch to it on their next
+    request. Returns the snapshot directory.
+    """
+    snapshots_dir = os.path.join(storage_dir, SNAPSHOTS_DIR)
+    version = str(time.time_ns())
+    snapshot_dir = os.path.join(snapshots_dir, version)
+
+    # build aside and rename into place, so a failed export leaves no partial snapshot
+    build_dir = f"{snapshot_dir}{BUILD_SUFFIX}"
+    os.makedirs(build_dir)
+    try:
+        _write_snapshot(storage_dir, build_dir, quantization)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    os.rename(build_dir, snapshot_dir)
+
+    # switch atomically, then drop old snapshots (already mapped files stay valid after unlinking)
+    current_tmp = os.path.join(snapshots_dir, f"{CURRENT_FILE}.tmp")
+    with open(current_tmp, "w") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(snapshots_dir, CURRENT_FILE))
+    versions = sorted(
+        (v for v in os.listdir(snapshots_dir) if v.isdigit()), key=int, reverse=True
+    )
+    # a worker may have just read CURRENT pointing at a replaced snapshot, give it time to load
+    cutoff = time.time_ns() - SNAPSHOT_GRACE_SECONDS * 1_000_000_000
+    for old in versions[SNAPSHOTS_TO_KEEP:]:
+        if int(old) > cutoff:
+            continue
+        shutil.rmtree(os.path.join(snapshots_dir, old), ignore_errors=True)
+    # builds left behind by exports that were killed midway
+    for name in os.listdir(snapshots_dir):
+        stale = name[: -len(BUILD_SUFFIX)]
+        if name.endswith(BUILD_SUFFIX) and stale.isdigit() and int(stale) < cutoff:
+            shutil.rmtree(os.path.join(snapshots_dir, name), ignore_errors=True)
+
+    return snapshot_dir
+
+
+def _write_snapshot(storage_dir: str, snapshot_dir: str, quantization: str) -> None:
+    # embeddings as one normalized float32 matrix
+    embedding_dict = _read_json(_vector_store_path(storage_dir))["embedding_dict"]
+    ids = list(embedding_dict.keys())
+    embeddings = np.array([embedding_dict[i] for i in ids], dtype=np.float32)
+    if len(ids):
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.where(norms == 0, 1.0, norms)
+    np.save(os.path.join(snapshot_dir, EMBEDDINGS_FILE), embeddings)
+    _write_json(os.path.join(snapshot_dir, EMBEDDING_IDS_FILE), ids)
+    save_quantized(snapshot_dir, embeddings, quantization, PQ_SUBSPACES)
+
+    # node store values back to back, located by (offset, length)
+    offsets: Dict[str, Dict[str, Tuple[int, int]]] = {}
+    with open(os.path.join(snapshot_dir, DOCSTORE_FILE), "wb") as f:
+        for collection, values in _read_json(
+            os.path.join(storage_dir, "docstore.json")
+        ).items():
+            offsets[collection] = {}
+            for key, value in values.items():
+                data = json.dumps(value).encode("utf-8")
+                offsets[collection][key] = (f.tell(), len(data))
+                f.write(data)
+    _write_json(os.path.join(snapshot_dir, DOCSTORE_OFFSETS_FILE), offsets)
+
+    for name in COPIED_FILES:
+        path = os.path.join(storage_dir, name)
+        if os.path.exists(path):
+            shutil.copy(path, snapshot_dir)
+
+
+def get_current_snapshot(storage_dir: str) -> Optional[str]:
+    """Return the name of the current snapshot, or None if there is none."""
+    try:
+        with open(os.path.join(storage_dir, SNAPSHOTS_DIR, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_snapshot_storage_context(storage_dir: str, version: str) -> StorageContext:
+    snapshot_dir = os.path.join(storage_dir, SNAPSHOTS_DIR, version)
+    docstore = KVDocumentStore(
+        MmapKVStore(
+            os.path.join(snapshot_dir, DOCSTORE_FILE),
+            os.path.join(snapshot_dir, DOCSTORE_OFFSETS_FILE),
+        )
+    )
+    vector_store = MmapVectorStore(
+        os.path.join(snapshot_dir, EMBEDDINGS_FILE),
+        os.path.join(snapshot_dir, EMBEDDING_IDS_FILE),
+        approximate_scorer=load_scorer(snapshot_dir, VECTOR_QUANTIZATION),
+    )
+    return StorageContext.from_defaults(
+        persist_dir=snapshot_dir, docstore=docstore, vector_store=vector_store
+    )
+
+
+def get_snapshot_size(
+    storage_dir: str, version: str, quantization: str = VECTOR_QUANTIZATION
+) -> int:
+    """
+    Bytes of a snapshot that are read on every query. Quantized codes not in
+    use are left out, and when the codes in use exist the float32 matrix is
+    too, since only the re-ranked candidate rows of it are ever paged in.
+    """
+    snapshot_dir = os.path.join(storage_dir, SNAPSHOTS_DIR, version)
+    excluded = {name for files in QUANTIZED_FILES.values() for name in files}
+    if has_quantized(snapshot_dir, quantization):
+        excluded -= set(QUANTIZED_FILES[quantization])
+        excluded.add(EMBEDDINGS_FILE)
+    return sum(
+        entry.stat().st_size
+        for entry in os.scandir(snapshot_dir)
+        if entry.name not in excluded
+    )
+
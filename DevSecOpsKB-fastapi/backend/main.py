@@ -29,4 +29,9 @@ app.include_router(chat_router, prefix="/api/chat")
 
 
 if __name__ == "__main__":
-    uvicorn.run(app="main:app", host="0.0.0.0", reload=True)
+    if environment == "dev":
+        uvicorn.run(app="main:app", host="0.0.0.0", reload=True)
+    else:
+        # workers share the memory-mapped index snapshots through the OS page cache
+        workers = int(os.getenv("WORKERS", os.cpu_count() or 1))
+        uvicorn.run(app="main:app", host="0.0.0.0", workers=workers)
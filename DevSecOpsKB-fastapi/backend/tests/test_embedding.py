@@ -0,0 +1,140 @@
+import asyncio
+from typing import List
+
+import pytest
+from llama_index.embeddings.base import BaseEmbedding, Embedding
+
+from app.api.concurrency import track_spawned_tasks
+from app.engine.embedding import CachedQueryEmbedding, normalize_query
+
+
+class SlowEmbedding(BaseEmbedding):
+    """Embeds a text as its length, after a delay, recording every batch."""
+
+    batches: List[List[str]] = []
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return [float(len(query))]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return [float(len(text))]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        self.batches.append(texts)
+        await asyncio.sleep(0.1)
+        return [[float(len(text))] for text in texts]
+
+
+class FailingEmbedding(SlowEmbedding):
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        self.batches.append(texts)
+        await asyncio.sleep(0.1)
+        raise ValueError("embedding service unavailable")
+
+
+def test_normalize_query():
+    assert normalize_query("  What is  Trivy?\n") == normalize_query("what is trivy?")
+
+
+def test_lru_hit_and_eviction():
+    async def scenario():
+        embed_model = CachedQueryEmbedding(
+            SlowEmbedding(), cache_size=2, batch_window=0
+        )
+        for query in ["a", "bb", "a", "ccc", "a", "bb"]:
+            assert await embed_model.aget_query_embedding(query) == [float(len(query))]
+        # "a" stays cached as the most recently used, "bb" is evicted by "ccc"
+        assert embed_model._embed_model.batches == [["a"], ["bb"], ["ccc"], ["bb"]]
+
+    asyncio.run(scenario())
+
+
+def test_query_variants_share_one_entry():
+    async def scenario():
+        embed_model = CachedQueryEmbedding(SlowEmbedding(), batch_window=0)
+        await embed_model.aget_query_embedding("What is Trivy?")
+        await embed_model.aget_query_embedding("  what is   TRIVY?\n")
+        assert embed_model._embed_model.batches == [["What is Trivy?"]]
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_queries_are_coalesced():
+    async def scenario():
+        embed_model = CachedQueryEmbedding(SlowEmbedding(), batch_window=0.01)
+        queries = ["one", "two", "three", "four", "Two"]
+        embeddings = await asyncio.gather(
+            *(embed_model.aget_query_embedding(query) for query in queries)
+        )
+        assert embeddings == [[float(len(query))] for query in queries]
+        assert embed_model._embed_model.batches == [["one", "two", "three", "four"]]
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_fails_every_caller():
+    async def scenario():
+        embed_model = CachedQueryEmbedding(FailingEmbedding(), batch_window=0.01)
+        results = await asyncio.gather(
+            *(embed_model.aget_query_embedding(query) for query in ["a", "b", "A"]),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert embed_model._embed_model.batches == [["a", "b"]]
+        # nothing failed is cached, the next query is embedded again
+        with pytest.raises(ValueError):
+            await embed_model.aget_query_embedding("a")
+        assert len(embed_model._embed_model.batches) == 2
+
+    asyncio.run(scenario())
+
+
+def test_disconnect_does_not_cancel_shared_batch():
+    async def scenario():
+        embed_model = CachedQueryEmbedding(SlowEmbedding(), batch_window=0.01)
+
+        # request A opens the batch from a tracked task, as the chat endpoint does
+        a_tasks = set()
+        with track_spawned_tasks(a_tasks):
+            a = asyncio.create_task(embed_model.aget_query_embedding("first query"))
+        await asyncio.sleep(0)
+        b = asyncio.create_task(embed_model.aget_query_embedding("second"))
+
+        # A disconnects once the batch is in flight, its tasks are cancelled
+        await asyncio.sleep(0.05)
+        assert embed_model._batch_tasks.isdisjoint(a_tasks)
+        for task in a_tasks:
+            task.cancel()
+
+        assert await b == [6.0]
+        assert a.cancelled()
+        assert embed_model._embed_model.batches == [["first query", "second"]]
+
+    asyncio.run(scenario())
+
+
+def test_disconnect_does_not_cancel_full_batch():
+    async def scenario():
+        embed_model = CachedQueryEmbedding(
+            SlowEmbedding(embed_batch_size=2), batch_window=10
+        )
+
+        # B waits in the batch, then A's query fills it and flushes it right away
+        b = asyncio.create_task(embed_model.aget_query_embedding("second"))
+        await asyncio.sleep(0)
+        a_tasks = set()
+        with track_spawned_tasks(a_tasks):
+            a = asyncio.create_task(embed_model.aget_query_embedding("first query"))
+
+        await asyncio.sleep(0.05)
+        assert embed_model._batch_tasks.isdisjoint(a_tasks)
+        for task in a_tasks:
+            task.cancel()
+
+        assert await b == [6.0]
+        assert a.cancelled()
+
+    asyncio.run(scenario())
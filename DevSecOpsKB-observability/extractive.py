@@ -0,0 +1,30 @@
+from llama_index.indices.query.schema import QueryBundle
+import os
+
+def extractive_answer(nodes, threshold=None):
+    # similarity score at or above which the top retrieved passage is returned as the answer without calling the LLM, tune it with kb-threshold-tuning.py
+    # read on each call so a value from .env is honored regardless of import order
+    if threshold is None:
+        threshold = float(os.getenv("EXTRACTIVE_SCORE_THRESHOLD", "0.88"))
+
+    #lookup-style questions are answered by a single confident passage, skip the LLM for those
+    if nodes and nodes[0].score is not None and nodes[0].score >= threshold:
+        top = nodes[0]
+        source = (top.node.extra_info or {}).get("file_name", "unknown source")
+        return f"{top.node.get_text().strip()}\n\n(Source: {source})"
+    return None
+
+def extractive_querying(query_engine, input_text):
+
+    #retrieves the candidate passages once, they are reused for synthesis if needed
+    query_bundle = QueryBundle(input_text)
+    nodes = query_engine.retrieve(query_bundle)
+
+    answer = extractive_answer(nodes)
+    if answer is not None:
+        return answer
+
+    #otherwise synthesize an answer with the LLM from the retrieved passages
+    response = query_engine.synthesize(query_bundle, nodes)
+
+    return response.response
@@ -1,6 +1,8 @@
 from llama_index import SimpleDirectoryReader, LLMPredictor, ServiceContext, GPTVectorStoreIndex
 from langchain.chat_models import ChatOpenAI
 from dotenv import load_dotenv
+from doc_cache import file_extractor, pdf_reader
+from extractive import extractive_querying
 import os
 import graphsignal
 import logging
@@ -31,7 +33,8 @@ from llama_index import set_global_service_context
 set_global_service_context(service_context)
 
 #loads data from the specified directory path
-documents = SimpleDirectoryReader("./data").load_data()
+documents = SimpleDirectoryReader("./data", file_extractor=file_extractor()).load_data()
+print(pdf_reader.report())
 
 #when first building the index
 index = GPTVectorStoreIndex.from_documents(documents)
@@ -39,9 +42,7 @@ index = GPTVectorStoreIndex.from_documents(documents)
 def data_querying(input_text):
     
     #queries the index with the input text
-    response = index.as_query_engine().query(input_text)
-    
-    return response.response
+    return extractive_querying(index.as_query_engine(), input_text)
     
 
 # predefine a list of 10 questions
@@ -0,0 +1,88 @@
+from llama_index import SimpleDirectoryReader, LLMPredictor, ServiceContext, GPTVectorStoreIndex, Prompt
+from llama_index.indices.query.schema import QueryBundle
+from langchain.chat_models import ChatOpenAI
+from dotenv import load_dotenv
+from doc_cache import file_extractor, pdf_reader
+import time
+
+load_dotenv()
+
+# set context window
+context_window = 4096
+# set number of output tokens
+num_output = 512
+
+#LLMPredictor is a wrapper class around LangChain's LLMChain that allows easy integration into LlamaIndex
+llm_predictor = LLMPredictor(llm=ChatOpenAI(temperature=0, model_name="gpt-3.5-turbo", max_tokens=num_output))
+
+#constructs service_context
+service_context = ServiceContext.from_defaults(llm_predictor=llm_predictor, context_window=context_window, num_output=num_output)
+
+#set the global service context object
+from llama_index import set_global_service_context
+set_global_service_context(service_context)
+
+#loads data from the specified directory path
+documents = SimpleDirectoryReader("./data", file_extractor=file_extractor()).load_data()
+print(pdf_reader.report())
+
+#when first building the index
+index = GPTVectorStoreIndex.from_documents(documents)
+query_engine = index.as_query_engine()
+
+#asks whether the passage on its own, without any further synthesis, fully answers the question
+judge_prompt = Prompt(
+    "Question: {question}\n"
+    "Passage:\n"
+    "---------------------\n"
+    "{passage}\n"
+    "---------------------\n"
+    "Would showing this passage alone, with no rewriting, fully answer the question? "
+    "Answer with exactly one word, YES or NO.\n"
+)
+
+# the same benchmark questions used by kb-auto-run.py
+questions = [
+    'what does Trivy image scan do?',
+    'What are the main benefits of using Harden Runner?',
+    'What is the 3-2-1 rule in DevOps self-service model?',
+    'What is Infracost?  and what does it do?',
+    'What is the terraform command to auto generate README?',
+    'How to pin Terraform module source to a particular branch?',
+    'What are the benefits of reusable Terraform modules?',
+    'How do I resolve error "npm ERR! code E400"?',
+    'How to fix error "NoCredentialProviders: no valid providers in chain"?',
+    'How to fix error "Credentials could not be loaded, please check your action inputs: Could not load credentials from any providers"?'
+]
+
+results = []
+for question in questions:
+    query_bundle = QueryBundle(question)
+
+    start_time = time.time()
+    nodes = query_engine.retrieve(query_bundle)
+    retrieve_seconds = time.time() - start_time
+
+    start_time = time.time()
+    query_engine.synthesize(query_bundle, nodes)
+    synthesize_seconds = time.time() - start_time
+
+    #checks whether the top passage on its own is an acceptable answer
+    top = nodes[0]
+    verdict, _ = llm_predictor.predict(judge_prompt, question=question, passage=top.node.get_text())
+    answered = verdict.strip().upper().startswith("YES")
+
+    results.append((top.score, answered))
+    print(f"score={top.score:.4f} answered={answered} retrieve={retrieve_seconds:.2f}s synthesize={synthesize_seconds:.2f}s  {question}")
+
+# the lowest threshold above which every passage answers its question on its own
+threshold = max([score for score, answered in results if not answered], default=0.0)
+candidates = [score for score, answered in results if answered and score > threshold]
+if candidates:
+    threshold = min(candidates)
+    fast_path = len(candidates)
+else:
+    threshold = 1.0
+    fast_path = 0
+
+print(f"suggested EXTRACTIVE_SCORE_THRESHOLD={threshold:.4f}, skipping the LLM for {fast_path} of {len(questions)} questions")
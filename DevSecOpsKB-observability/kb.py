@@ -1,6 +1,8 @@
 from llama_index import SimpleDirectoryReader, LLMPredictor, StorageContext, ServiceContext, GPTVectorStoreIndex, load_index_from_storage
 from langchain.chat_models import ChatOpenAI
 from dotenv import load_dotenv
+from doc_cache import file_extractor, pdf_reader
+from extractive import extractive_querying
 import gradio as gr
 import os
 import graphsignal
@@ -30,7 +32,8 @@ set_global_service_context(service_context)
 def data_ingestion_indexing(directory_path):
 
     #loads data from the specified directory path
-    documents = SimpleDirectoryReader(directory_path).load_data()
+    documents = SimpleDirectoryReader(directory_path, file_extractor=file_extractor()).load_data()
+    print(pdf_reader.report())
     
     #when first building the index
     index = GPTVectorStoreIndex.from_documents(documents)
@@ -49,9 +52,7 @@ def data_querying(input_text):
     index = load_index_from_storage(storage_context)
     
     #queries the index with the input text
-    response = index.as_query_engine().query(input_text)
-    
-    return response.response
+    return extractive_querying(index.as_query_engine(), input_text)
 
 iface = gr.Interface(fn=data_querying,
                      inputs=gr.components.Textbox(lines=7, label="Enter your question"),
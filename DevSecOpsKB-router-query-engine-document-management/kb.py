@@ -7,16 +7,20 @@ from llama_index import (
     StorageContext,
 )
 from llama_index.indices.loading import load_index_from_storage
+from llama_index.indices.query.base import BaseQueryEngine
 from llama_index.tools.query_engine import QueryEngineTool
 from llama_index.query_engine.router_query_engine import RouterQueryEngine
+from llama_index.query_engine.sub_question_query_engine import SubQuestionQueryEngine
 from llama_index.selectors.llm_selectors import LLMSingleSelector
 from langchain.chat_models import ChatOpenAI
 from dotenv import load_dotenv
+from doc_cache import file_extractor, pdf_reader
 import openai
 import gradio as gr
 import sys, os
 import logging
 import atexit
+import asyncio
 import uuid
 
 # loads dotenv lib to retrieve API keys from .env file
@@ -37,6 +41,26 @@ llm_predictor = LLMPredictor(llm=ChatOpenAI(temperature=0, model_name="gpt-3.5-t
 # define LLM service context
 service_context = ServiceContext.from_defaults(llm_predictor=llm_predictor, chunk_size=1024)
 
+# "router" sends the whole question to one index, "sub_question" splits compound questions into sub-questions answered concurrently
+query_mode = os.getenv("QUERY_MODE", "router")
+if query_mode not in ("router", "sub_question"):
+    raise ValueError(f"Unknown QUERY_MODE {query_mode!r}, expected 'router' or 'sub_question'")
+
+class ThreadedRetrievalQueryEngine(BaseQueryEngine):
+    """Query engine whose async queries retrieve in a worker thread, so the blocking query embedding call of one sub-question doesn't hold up the others."""
+
+    def __init__(self, query_engine):
+        super().__init__(query_engine.callback_manager)
+        self.query_engine = query_engine
+
+    def _query(self, query_bundle):
+        return self.query_engine.query(query_bundle)
+
+    async def _aquery(self, query_bundle):
+        # llama_index 0.6.38 retrieves synchronously even in aquery, only synthesis is async
+        nodes = await asyncio.get_running_loop().run_in_executor(None, self.query_engine.retrieve, query_bundle)
+        return await self.query_engine.asynthesize(query_bundle, nodes)
+
 # file path for storing the variables for list_id and vector_id
 variables_file = "variables.txt"
 
@@ -63,8 +87,9 @@ def load_index(directory_path):
     global list_id, vector_id  
     
     # load data
-    documents = SimpleDirectoryReader(directory_path, filename_as_id=True).load_data()
+    documents = SimpleDirectoryReader(directory_path, filename_as_id=True, file_extractor=file_extractor()).load_data()
     print(f"loaded {len(documents)} documents")
+    print(pdf_reader.report())
     
     # get nodes
     nodes = service_context.node_parser.get_nodes_from_documents(documents)
@@ -106,21 +131,34 @@ def load_index(directory_path):
     # build list_tool and vector_tool
     list_tool = QueryEngineTool.from_defaults(
         query_engine=list_query_engine,
+        name="list_index",
         description="Useful for summarization questions on DevSecOps tooling.",
     )
     vector_tool = QueryEngineTool.from_defaults(
         query_engine=vector_query_engine,
+        name="vector_index",
         description="Useful for retrieving specific context on DevSecOps tooling.",
     )
 
-    # construct RouterQueryEngine
-    query_engine = RouterQueryEngine(
-        selector=LLMSingleSelector.from_defaults(),
-        query_engine_tools=[
-            list_tool,
-            vector_tool,
-        ]
-    )
+    if query_mode == "sub_question":
+        # construct SubQuestionQueryEngine, sub-questions are generated against both tools, run concurrently with asyncio, then merged into one answer
+        query_engine = SubQuestionQueryEngine.from_defaults(
+            query_engine_tools=[
+                QueryEngineTool(query_engine=ThreadedRetrievalQueryEngine(tool.query_engine), metadata=tool.metadata)
+                for tool in [list_tool, vector_tool]
+            ],
+            service_context=service_context,
+            use_async=True,
+        )
+    else:
+        # construct RouterQueryEngine
+        query_engine = RouterQueryEngine(
+            selector=LLMSingleSelector.from_defaults(),
+            query_engine_tools=[
+                list_tool,
+                vector_tool,
+            ]
+        )
     
     # run refresh_ref_docs function to check for document updates
     list_refreshed_docs = list_index.refresh_ref_docs(documents, update_kwargs={"delete_kwargs": {'delete_from_docstore': True}})
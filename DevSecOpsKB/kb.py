@@ -1,5 +1,6 @@
 from llama_index import SimpleDirectoryReader, LLMPredictor, PromptHelper, StorageContext, ServiceContext, GPTVectorStoreIndex, load_index_from_storage
 from langchain.chat_models import ChatOpenAI
+from doc_cache import file_extractor, pdf_reader
 import gradio as gr
 import sys
 import os
@@ -28,7 +29,8 @@ def create_service_context():
 def data_ingestion_indexing(directory_path):
 
     #loads data from the specified directory path
-    documents = SimpleDirectoryReader(directory_path).load_data()
+    documents = SimpleDirectoryReader(directory_path, file_extractor=file_extractor()).load_data()
+    print(pdf_reader.report())
     
     #when first building the index
     index = GPTVectorStoreIndex.from_documents(